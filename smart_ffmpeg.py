@@ -1,49 +1,132 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
 import os
 import sys
+import atexit
 import subprocess
 import shlex
-import json
-from typing import Optional, List, Dict
+import shutil
+import hashlib
+import sqlite3
+import select
+import time
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, List, Dict
 from pathlib import Path
 
+import orjson
 from rich.console import Console
+from rich.live import Live
 from rich.prompt import Prompt
 from rich.panel import Panel
+from rich.spinner import Spinner
+from rich.status import Status
 from rich.syntax import Syntax
-from dotenv import load_dotenv
-from openai import OpenAI
-import questionary
+from rich.text import Text
+from pygments.lexers.shell import BashLexer
 import tempfile
 
-# Load environment variables
-load_dotenv()
+# openai, httpx, questionary, dotenv and asyncio are imported where they are
+# used, so startup and slash commands don't pay for them
+if TYPE_CHECKING:
+    import asyncio
+
+    from openai import OpenAI
+
+# Load environment variables unless the shell already provides them
+if not (os.getenv("OPENROUTER_API_KEY") and os.getenv("OPENROUTER_MODEL")):
+    from dotenv import load_dotenv
+
+    load_dotenv()
 
 console = Console()
 
-DEFAULT_SYSTEM_PROMPT = """
+# Shared so highlighting a command doesn't look up and build a new lexer each time
+BASH_LEXER = BashLexer()
+
+BANNER = r"""
+ [bold blue]_____                      _      ____________                          
+/  ___|                    | |     |  ___|  ___|                         
+\ `--. _ __ ___   __ _ _ __| |_    | |_  | |_ _ __ ___  _ __   ___  __ _ 
+ `--. \ '_ ` _ \ / _` | '__| __|   |  _| |  _| '_ ` _ \| '_ \ / _ \/ _` |
+/\__/ / | | | | | (_| | |  | |_    | |   | | | | | | | | |_) |  __/ (_| |
+\____/|_| |_| |_|\__,_|_|   \__|   \_|   \_| |_| |_| |_| .__/ \___|\__, |
+                                                       | |          __/ |
+                                                       |_|         |___/ [/bold blue]
+    """
+
+DEFAULT_SYSTEM_PROMPT = sys.intern(
+    """
 You are an expert FFmpeg command generator. 
 Your task is to translate the user's natural language request into a valid, efficient FFmpeg command.
 
 You must output your response in valid JSON format with the following structure:
 {
     "command": "the full ffmpeg command here",
+    "argv": ["ffmpeg", "-i", "input.mp4", "..."],
     "explanation": "a brief explanation of what the command does"
 }
 
+- "argv" is the same command as a list of arguments, exactly as it would be passed to the program, without shell quoting.
 - Ensure the command is safe and correct.
 - Do not include markdown formatting (like ```json) around the output, just the raw JSON string.
 - If the user's request is ambiguous, make a reasonable assumption and note it in the explanation.
 - Assume standard input/output filenames if none are provided (e.g., input.mp4, output.mp4), or placeholders like <input_file>.
 """.strip()
+)
+
+BATCH_INSTRUCTIONS = """
+The user message contains several numbered requests. Answer each one independently.
+Respond with a single JSON object of the form {"results": [...]}, where "results" holds
+one object per request, in the same order, each using the structure described above.
+""".strip()
+
+# Prompts submitted within this window of each other are sent as one request
+BATCH_WINDOW = 0.25
+BATCH_SIZE = 4
+
+# Opening ``` / ```json and closing ``` fences around a model response
+MARKDOWN_FENCE_RE = re.compile(r"\A```(?:json)?\s*|\s*```\Z")
+
+# Media file names in a prompt, optionally quoted so they may contain spaces
+MEDIA_EXTENSIONS = (
+    "mp4|mkv|mov|avi|webm|flv|wmv|m4v|ts|mts|mpg|mpeg|gif|mp3|m4a|aac|wav|flac|ogg|opus"
+)
+MEDIA_FILE_RE = re.compile(
+    rf"\"([^\"]+\.(?:{MEDIA_EXTENSIONS}))\""
+    rf"|'([^']+\.(?:{MEDIA_EXTENSIONS}))'"
+    rf"|([^\s\"',;()]+\.(?:{MEDIA_EXTENSIONS}))\b",
+    re.IGNORECASE,
+)
+
+# Single-key answers for the menu shown after each generated command
+MENU_CHOICES = {
+    "a": "Allow (Run command)",
+    "w": "Always Allow (Save preference & Run)",
+    "c": "Make Changes (Refine command)",
+    "r": "Reject (Cancel)",
+}
+
+# Histories longer than this many messages are collapsed into a summary
+HISTORY_LIMIT = 6
+
+# FFmpeg output is read in large chunks and printed at most this often
+READ_CHUNK_SIZE = 64 * 1024
+PRINT_INTERVAL = 0.05
 
 
 class Config:
     def __init__(self):
         self.config_dir = Path.home() / ".config" / "smart-ffmpeg"
         self.config_file = self.config_dir / "config.json"
+        self._dirty = False
+        self._written_digest: Optional[bytes] = None
         self.ensure_config_dir()
         self.data = self.load_config()
+        # Changes are buffered in memory and written once at exit or a save point
+        atexit.register(self.save_config)
 
     def ensure_config_dir(self):
         if not self.config_dir.exists():
@@ -52,15 +135,39 @@ class Config:
     def load_config(self) -> Dict:
         if self.config_file.exists():
             try:
-                with open(self.config_file, "r") as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
+                with open(self.config_file, "rb") as f:
+                    raw = f.read()
+                data = orjson.loads(raw)
+                self._written_digest = hashlib.sha256(raw).digest()
+                return data
+            except orjson.JSONDecodeError:
                 return {"always_allow": False}
         return {"always_allow": False, "custom_system_prompt": None}
 
+    def mark_dirty(self):
+        self._dirty = True
+
+    # Explicit edits (API key, model, system prompt) call save_config() right
+    # away; frequent toggles like /mode stay buffered until exit or the next run.
     def save_config(self):
-        with open(self.config_file, "w") as f:
-            json.dump(self.data, f, indent=4)
+        """
+        Atomically writes pending changes, skipping the write if nothing changed on disk.
+        """
+        if not self._dirty:
+            return
+
+        payload = orjson.dumps(self.data, option=orjson.OPT_INDENT_2)
+        digest = hashlib.sha256(payload).digest()
+        if digest != self._written_digest:
+            tmp_file = self.config_file.with_name(self.config_file.name + ".tmp")
+            with open(tmp_file, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.config_file)
+            self._written_digest = digest
+
+        self._dirty = False
 
     @property
     def always_allow(self) -> bool:
@@ -69,7 +176,7 @@ class Config:
     @always_allow.setter
     def always_allow(self, value: bool):
         self.data["always_allow"] = value
-        self.save_config()
+        self.mark_dirty()
 
     @property
     def custom_system_prompt(self) -> Optional[str]:
@@ -78,7 +185,7 @@ class Config:
     @custom_system_prompt.setter
     def custom_system_prompt(self, value: Optional[str]):
         self.data["custom_system_prompt"] = value
-        self.save_config()
+        self.mark_dirty()
 
     @property
     def verbose(self) -> bool:
@@ -87,7 +194,16 @@ class Config:
     @verbose.setter
     def verbose(self, value: bool):
         self.data["verbose"] = value
-        self.save_config()
+        self.mark_dirty()
+
+    @property
+    def prompt_caching(self) -> bool:
+        return self.data.get("prompt_caching", True)
+
+    @prompt_caching.setter
+    def prompt_caching(self, value: bool):
+        self.data["prompt_caching"] = value
+        self.mark_dirty()
 
     @property
     def model(self) -> Optional[str]:
@@ -96,7 +212,7 @@ class Config:
     @model.setter
     def model(self, value: str):
         self.data["model"] = value
-        self.save_config()
+        self.mark_dirty()
 
     @property
     def api_key(self) -> Optional[str]:
@@ -105,12 +221,221 @@ class Config:
     @api_key.setter
     def api_key(self, value: str):
         self.data["api_key"] = value
-        self.save_config()
+        self.mark_dirty()
 
 
 config = Config()
 
 
+class CommandCache:
+    """
+    Persists generated commands keyed by (model, system prompt, user prompt)
+    so repeated requests skip the API round-trip.
+    """
+
+    def __init__(self, config_dir: Path):
+        self.cache_file = config_dir / "cache.sqlite"
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def _digest(*parts: str) -> bytes:
+        return hashlib.sha256("\0".join(parts).encode()).digest()
+
+    @staticmethod
+    @lru_cache(maxsize=4)
+    def _system_digest(system_prompt: str) -> bytes:
+        # The system prompt rarely changes, so hash it once rather than per lookup
+        return CommandCache._digest(system_prompt)
+
+    @staticmethod
+    def _normalize(prompt: str) -> str:
+        # Only whitespace is collapsed: prompts contain case-sensitive file paths
+        return " ".join(prompt.split())
+
+    def _connect(self, system_prompt_hash: bytes) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.cache_file)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS commands ("
+                "prompt_hash BLOB PRIMARY KEY, "
+                "system_prompt_hash BLOB NOT NULL, "
+                "result BLOB NOT NULL)"
+            )
+            # Entries generated under a different system prompt are stale
+            self._conn.execute(
+                "DELETE FROM commands WHERE system_prompt_hash != ?",
+                (system_prompt_hash,),
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, model: str, system_prompt: str, prompt: str) -> Optional[Dict]:
+        system_prompt_hash = self._system_digest(system_prompt)
+        prompt_hash = self._digest(
+            model, system_prompt_hash.hex(), self._normalize(prompt)
+        )
+        try:
+            row = (
+                self._connect(system_prompt_hash)
+                .execute(
+                    "SELECT result FROM commands "
+                    "WHERE prompt_hash = ? AND system_prompt_hash = ?",
+                    (prompt_hash, system_prompt_hash),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        try:
+            result = orjson.loads(row[0])
+        except orjson.JSONDecodeError:
+            return None
+        return None if validate_result(result) else result
+
+    def put(self, model: str, system_prompt: str, prompt: str, result: Dict):
+        if validate_result(result):
+            return
+        # Store exactly what is needed to replay the command, argv included
+        stored = {
+            key: result[key]
+            for key in ("command", "argv", "explanation")
+            if result.get(key) is not None
+        }
+        system_prompt_hash = self._system_digest(system_prompt)
+        prompt_hash = self._digest(
+            model, system_prompt_hash.hex(), self._normalize(prompt)
+        )
+        try:
+            conn = self._connect(system_prompt_hash)
+            conn.execute(
+                "INSERT OR REPLACE INTO commands VALUES (?, ?, ?)",
+                (prompt_hash, system_prompt_hash, orjson.dumps(stored)),
+            )
+            conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        if self.cache_file.exists():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self.cache_file.unlink()
+
+
+command_cache = CommandCache(config.config_dir)
+
+
+class MediaMetadataCache:
+    """
+    Memoizes ffprobe stream metadata per file in metadata.json, keyed by path
+    and modification time so edited files are probed again.
+    """
+
+    # Only the fields that matter for writing a command are kept, to keep the prompt short
+    STREAM_FIELDS = (
+        "index",
+        "codec_type",
+        "codec_name",
+        "profile",
+        "width",
+        "height",
+        "pix_fmt",
+        "r_frame_rate",
+        "sample_rate",
+        "channels",
+        "channel_layout",
+        "duration",
+        "bit_rate",
+    )
+
+    def __init__(self, config_dir: Path):
+        self.cache_file = config_dir / "metadata.json"
+        self._data: Optional[Dict] = None
+
+    def _load(self) -> Dict:
+        if self._data is None:
+            try:
+                with open(self.cache_file, "rb") as f:
+                    data = orjson.loads(f.read())
+            except (OSError, orjson.JSONDecodeError):
+                data = None
+            self._data = data if isinstance(data, dict) else {}
+        return self._data
+
+    def _save(self):
+        # Forget files that have been deleted so the cache doesn't grow forever
+        self._data = {
+            path: entry for path, entry in self._data.items() if os.path.exists(path)
+        }
+        tmp_file = self.cache_file.with_name(self.cache_file.name + ".tmp")
+        with open(tmp_file, "wb") as f:
+            f.write(orjson.dumps(self._data))
+        os.replace(tmp_file, self.cache_file)
+
+    def get(self, path: str) -> Optional[List[Dict]]:
+        try:
+            path = os.path.abspath(path)
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        data = self._load()
+        entry = data.get(path)
+        if isinstance(entry, dict) and entry.get("mtime") == mtime:
+            streams = entry.get("streams")
+            if isinstance(streams, list):
+                return streams
+
+        streams = self._probe(path)
+        if streams is None:
+            return None
+
+        data[path] = {"mtime": mtime, "streams": streams}
+        try:
+            self._save()
+        except OSError:
+            pass
+        return streams
+
+    def _probe(self, path: str) -> Optional[List[Dict]]:
+        if ffprobe_path() is None:
+            return None
+        try:
+            output = subprocess.run(
+                [
+                    ffprobe_path(),
+                    "-v",
+                    "quiet",
+                    "-print_format",
+                    "json",
+                    "-show_streams",
+                    path,
+                ],
+                capture_output=True,
+                timeout=10,
+                check=True,
+            ).stdout
+            probed = orjson.loads(output)
+        except (OSError, subprocess.SubprocessError, orjson.JSONDecodeError):
+            return None
+
+        streams = probed.get("streams") if isinstance(probed, dict) else None
+        if not isinstance(streams, list):
+            return None
+
+        return [
+            {key: stream[key] for key in self.STREAM_FIELDS if key in stream}
+            for stream in streams
+            if isinstance(stream, dict)
+        ]
+
+
+media_metadata = MediaMetadataCache(config.config_dir)
+
+
 def get_api_key() -> str:
     if config.api_key:
         return config.api_key
@@ -120,10 +445,13 @@ def get_api_key() -> str:
         return api_key
 
     console.print("[yellow]No API key found.[/yellow]")
+    import questionary
+
     api_key = questionary.password("Please enter your OpenRouter API Key:").ask()
 
     if api_key:
         config.api_key = api_key
+        config.save_config()
         console.print("[green]API Key saved to config.[/green]")
         return api_key
 
@@ -140,12 +468,15 @@ def ensure_model_name() -> str:
         return model
 
     console.print("[yellow]No model configured.[/yellow]")
+    import questionary
+
     model = questionary.text(
         "Please enter the Model Name (e.g. google/gemini-2.0-flash-001):"
     ).ask()
 
     if model:
         config.model = model
+        config.save_config()
         console.print("[green]Model name saved to config.[/green]")
         return model
 
@@ -153,85 +484,420 @@ def ensure_model_name() -> str:
     sys.exit(1)
 
 
-def get_ffmpeg_command(client: OpenAI, messages: List[Dict], model: str = None) -> dict:
-    """
-    Generates an FFmpeg command from a conversation history using OpenRouter.
-    Returns a dictionary with 'command' and 'explanation'.
-    """
-    if model is None:
-        model = config.model or os.getenv("OPENROUTER_MODEL")
-
-    if not model:
-        raise ValueError("Model name is not configured.")
+def build_system_message(system_prompt: str) -> Dict:
+    if config.prompt_caching:
+        # Multi-part form so OpenRouter can pass the cache breakpoint through
+        # to providers that support it; only the stable system prefix is cached.
+        return {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        }
+    return {"role": "system", "content": system_prompt}
 
-    if config.custom_system_prompt:
-        system_prompt = config.custom_system_prompt
-    else:
-        system_prompt = DEFAULT_SYSTEM_PROMPT
 
-    conversation = [{"role": "system", "content": system_prompt}] + messages
+class JsonObjectScanner:
+    """
+    Follows brace depth across streamed chunks to detect when the top-level
+    JSON object has been closed, ignoring braces inside strings.
+    """
 
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> Optional[int]:
+        """
+        Consumes a chunk, returning the index just past the closing brace if the
+        object ended within it.
+        """
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return None
+
+
+def validate_result(result) -> Optional[str]:
+    """
+    Checks a generated result's structure, returning an error message if it is invalid.
+    """
+    if not isinstance(result, dict):
+        return "expected a JSON object"
+    for key in ("command", "explanation"):
+        if not isinstance(result.get(key), str):
+            return f"missing or non-string '{key}'"
+    argv = result.get("argv")
+    if argv is not None and not (
+        isinstance(argv, list) and all(isinstance(a, str) for a in argv)
+    ):
+        return "'argv' must be a list of strings"
+    return None
+
+
+def stream_json_completion(
+    client: OpenAI, model: str, conversation: List[Dict], exit_on_error: bool = True
+):
+    """
+    Streams a JSON-mode chat completion, showing it live, and returns the parsed JSON.
+    On an API or parse error it exits, or returns None if `exit_on_error` is False.
+    """
+    content = ""
     try:
-        response = client.chat.completions.create(
+        stream = client.chat.completions.create(
             model=model,
             messages=conversation,
             response_format={"type": "json_object"},
+            stream=True,
         )
 
-        content = response.choices[0].message.content.strip()
+        # Show the response as it arrives instead of waiting for the full body
+        with Live(
+            Spinner("arc", text="[bold cyan]Generating command...[/bold cyan]"),
+            console=console,
+            transient=True,
+        ) as live:
+            chunks = []
+            scanner = JsonObjectScanner()
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                end = scanner.feed(delta)
+                chunks.append(delta if end is None else delta[:end])
+                live.update(
+                    Panel(
+                        Text("".join(chunks), style="dim"),
+                        title="Generating command...",
+                        title_align="left",
+                        border_style="cyan",
+                    )
+                )
+                if end is not None:
+                    # The object is complete; stop paying for trailing tokens
+                    stream.close()
+                    break
+
+        content = "".join(chunks).strip()
 
         # cleanup markdown if the model adds it despite instructions
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
+        content = MARKDOWN_FENCE_RE.sub("", content).strip()
 
-        return json.loads(content.strip())
-    except json.JSONDecodeError:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        if not exit_on_error:
+            return None
         console.print(
             "[bold red]Error:[/bold red] Failed to parse model response as JSON."
         )
         console.print(f"Raw response: {content}")
         sys.exit(1)
     except Exception as e:
+        if not exit_on_error:
+            return None
         console.print(f"[bold red]Error generating command:[/bold red] {str(e)}")
         sys.exit(1)
 
 
-def run_ffmpeg_command(command: str):
+def resolve_model(model: Optional[str]) -> str:
+    if model is None:
+        model = config.model or os.getenv("OPENROUTER_MODEL")
+
+    if not model:
+        raise ValueError("Model name is not configured.")
+
+    return model
+
+
+def current_system_prompt() -> str:
+    if config.custom_system_prompt:
+        return config.custom_system_prompt
+    return DEFAULT_SYSTEM_PROMPT
+
+
+def get_ffmpeg_command(client: OpenAI, messages: List[Dict], model: str = None) -> dict:
+    """
+    Generates an FFmpeg command from a conversation history using OpenRouter.
+    Returns a dictionary with 'command' and 'explanation', plus an optional 'argv'
+    list of arguments to run as-is.
+    """
+    model = resolve_model(model)
+    system_prompt = current_system_prompt()
+
+    # Only a fresh request is cacheable; refinements depend on the history
+    cacheable = len(messages) == 1 and messages[0]["role"] == "user"
+    if cacheable:
+        cached = command_cache.get(model, system_prompt, messages[0]["content"])
+        if cached is not None:
+            console.print("[dim]Using cached command for this request.[/dim]")
+            return cached
+
+    conversation = [build_system_message(system_prompt)] + messages
+    result = stream_json_completion(client, model, conversation)
+
+    error = validate_result(result)
+    if error:
+        console.print(
+            f"[bold red]Error:[/bold red] Invalid response from model: {error}."
+        )
+        console.print(f"Raw response: {orjson.dumps(result).decode()}")
+        sys.exit(1)
+
+    if cacheable:
+        command_cache.put(model, system_prompt, messages[0]["content"], result)
+    return result
+
+
+def get_ffmpeg_commands(
+    client: OpenAI, prompts: List[str], model: str = None
+) -> Optional[List[dict]]:
     """
-    Executes the FFmpeg command and streams output.
+    Generates one FFmpeg command per prompt in a single request.
+    Returns None if the request failed or the model did not answer every prompt.
     """
-    console.print("\n[bold green]Running command...[/bold green]")
+    model = resolve_model(model)
+    system_prompt = current_system_prompt()
+
+    numbered = "\n".join(f"{i}. {prompt}" for i, prompt in enumerate(prompts, 1))
+    conversation = [
+        build_system_message(system_prompt),
+        {"role": "system", "content": BATCH_INSTRUCTIONS},
+        {"role": "user", "content": numbered},
+    ]
+    # A failed batch is not fatal: the caller retries each prompt on its own
+    response = stream_json_completion(client, model, conversation, exit_on_error=False)
+
+    results = response.get("results") if isinstance(response, dict) else None
+    if not isinstance(results, list) or len(results) != len(prompts):
+        return None
+
+    if any(validate_result(result) for result in results):
+        return None
+
+    for prompt, result in zip(prompts, results):
+        command_cache.put(model, system_prompt, prompt, result)
+    return results
+
+
+def read_pending_lines(limit: int) -> List[str]:
+    """
+    Collects up to `limit` further lines that arrive on stdin within BATCH_WINDOW,
+    e.g. when several requests are pasted at once.
+    """
+    # select() only works on sockets on Windows
+    if os.name == "nt":
+        return []
+
+    lines = []
+    deadline = time.monotonic() + BATCH_WINDOW
+    while len(lines) < limit:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        ready, _, _ = select.select([sys.stdin], [], [], remaining)
+        if not ready:
+            break
+        try:
+            lines.append(input())
+        except EOFError:
+            break
+    return lines
+
+
+async def read_process_output(stream: asyncio.StreamReader, queue: asyncio.Queue):
+    """
+    Drains a process pipe in large chunks, queueing the complete lines of each
+    chunk in verbose mode. The pipe is always drained so FFmpeg never stalls on
+    a full pipe.
+    """
+    buffer = bytearray()
+
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if not config.verbose:
+            continue
+
+        # FFmpeg ends progress updates with \r rather than \n
+        buffer += chunk.replace(b"\r", b"\n")
+        *complete, buffer = buffer.split(b"\n")
+        lines = [
+            line.decode("utf-8", "replace").strip() for line in complete if line.strip()
+        ]
+        if lines:
+            await queue.put(lines)
+
+    if buffer.strip():
+        await queue.put([buffer.decode("utf-8", "replace").strip()])
+    await queue.put(None)
+
+
+async def print_process_output(queue: asyncio.Queue, status: Status):
+    """
+    Prints queued batches of lines at most every PRINT_INTERVAL until a None
+    sentinel arrives. The status spinner is stopped once output starts arriving.
+    """
+    import asyncio
+
+    while True:
+        batch = await queue.get()
+        if batch is None:
+            return
+        status.stop()
+
+        lines = list(batch)
+        done = False
+        while not queue.empty():
+            batch = queue.get_nowait()
+            if batch is None:
+                done = True
+                break
+            lines.extend(batch)
+
+        # Raw FFmpeg output needs no markup parsing, highlighting or wrapping
+        console.out("\n".join(lines), highlight=False)
+        if done:
+            return
+        await asyncio.sleep(PRINT_INTERVAL)
+
+
+async def stream_ffmpeg_process(args: List[str], status: Status) -> int:
+    """
+    Runs the command with separate reader and printer tasks so the pipe keeps
+    draining while Rich renders. Returns the exit code.
+    """
+    import asyncio
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,  # FFmpeg writes status to stderr
+        # With an absolute path and no fd closing, CPython launches the child
+        # via posix_spawn() instead of fork()+exec(). Our own descriptors are
+        # non-inheritable by default, so nothing leaks into ffmpeg.
+        close_fds=os.name == "nt",
+    )
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+    await asyncio.gather(
+        read_process_output(process.stdout, queue),
+        print_process_output(queue, status),
+    )
+    return await process.wait()
+
+
+def command_argv(result: dict) -> Optional[List[str]]:
+    """
+    Returns the argument list for a generated command, preferring the model's
+    'argv' field and falling back to splitting the 'command' string.
+    """
+    argv = result.get("argv")
+    if isinstance(argv, list) and argv and all(isinstance(a, str) for a in argv):
+        return argv
 
     try:
-        # Split command for subprocess
-        args = shlex.split(command)
+        return shlex.split(result.get("command") or "")
+    except ValueError:
+        return None
 
-        # Check if ffmpeg is installed
-        if args and args[0] != "ffmpeg":
-            # In case the model didn't start with ffmpeg or user aliased it,
-            # but usually we expect 'ffmpeg'. Let's trust the model but verify binary exists.
-            pass
 
-        process = subprocess.Popen(
-            args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,  # FFmpeg writes status to stderr
-            text=True,
-            bufsize=1,
+@lru_cache(maxsize=None)
+def ffmpeg_path() -> Optional[str]:
+    """
+    Resolves the absolute path of the ffmpeg binary once per process.
+    """
+    return shutil.which("ffmpeg")
+
+
+@lru_cache(maxsize=None)
+def ffprobe_path() -> Optional[str]:
+    """
+    Resolves the absolute path of the ffprobe binary once per process.
+    """
+    return shutil.which("ffprobe")
+
+
+def media_context(prompt: str) -> List[Dict]:
+    """
+    Returns a system message describing the existing media files named in the
+    prompt, or an empty list if there are none.
+    """
+    details = []
+    seen = set()
+    for match in MEDIA_FILE_RE.finditer(prompt):
+        path = next(group for group in match.groups() if group)
+        if path in seen or not os.path.isfile(path):
+            continue
+        seen.add(path)
+
+        streams = media_metadata.get(path)
+        if streams is not None:
+            details.append(f"{path}: {orjson.dumps(streams).decode()}")
+
+    if not details:
+        return []
+
+    return [
+        {
+            "role": "system",
+            "content": "Stream metadata (from ffprobe) for media files mentioned by the user:\n"
+            + "\n".join(details),
+        }
+    ]
+
+
+def run_ffmpeg_command(args: Optional[List[str]]):
+    """
+    Executes the FFmpeg command given as an argument list and streams output.
+    """
+    import asyncio
+
+    console.print("\n[bold green]Running command...[/bold green]")
+
+    # Persist any pending preference changes before a potentially long run
+    config.save_config()
+
+    if not args:
+        console.print(
+            "[bold red]Error:[/bold red] The generated command is empty or could not be parsed."
         )
+        return
+
+    # Run the binary resolved at startup rather than searching PATH again
+    if args[0] == "ffmpeg" and ffmpeg_path():
+        args = [ffmpeg_path()] + args[1:]
 
+    try:
         # Stream output
-        with console.status(
+        status = console.status(
             "[bold green]Processing video...[/bold green]", spinner="dots"
-        ):
-            for line in process.stdout:
-                # We can print the raw output or try to parse progress.
-                if config.verbose:
-                    console.print(line.strip(), highlight=False)
-
-        return_code = process.wait()
+        )
+        status.start()
+        try:
+            return_code = asyncio.run(stream_ffmpeg_process(args, status))
+        finally:
+            status.stop()
 
         if return_code == 0:
             console.print(
@@ -250,20 +916,40 @@ def run_ffmpeg_command(command: str):
         console.print(f"[bold red]Execution Error:[/bold red] {str(e)}")
 
 
-def process_request(client: OpenAI, initial_prompt: str):
+def compact_history(messages: List[Dict], initial_prompt: str) -> List[Dict]:
+    """
+    Keeps the refinement history at a fixed size by replacing older turns with a
+    short summary. The latest command and the newest refinement are kept verbatim,
+    and that command already reflects every earlier refinement.
+    """
+    if len(messages) <= HISTORY_LIMIT:
+        return messages
+
+    summary = {
+        "role": "system",
+        "content": (
+            f"Prior context: the original request was: {initial_prompt}\n"
+            "Earlier refinements are already reflected in the latest command below."
+        ),
+    }
+    return [summary] + messages[-3:]
+
+
+def process_request(initial_prompt: str, result: dict = None):
     messages = [{"role": "user", "content": initial_prompt}]
+    # Probed once per request so refinements reuse it
+    context = media_context(initial_prompt)
 
     while True:
-        with console.status(
-            "[bold cyan]Generating command...[/bold cyan]", spinner="arc"
-        ):
-            result = get_ffmpeg_command(client, messages)
+        if result is None:
+            result = get_ffmpeg_command(openrouter.get(), context + messages)
 
-        command = result.get("command")
+        argv = command_argv(result)
+        command = shlex.join(argv) if argv else result.get("command")
         explanation = result.get("explanation")
 
         console.print("\n[bold]Generated Command:[/bold]")
-        console.print(Syntax(command, "bash", theme="monokai", word_wrap=True))
+        console.print(Syntax(command, BASH_LEXER, theme="monokai", word_wrap=True))
         console.print(
             Panel(
                 explanation,
@@ -274,57 +960,50 @@ def process_request(client: OpenAI, initial_prompt: str):
         )
 
         # Add assistant response to history for context if user wants changes
-        messages.append({"role": "assistant", "content": json.dumps(result)})
+        messages.append({"role": "assistant", "content": orjson.dumps(result).decode()})
+        result = None
 
         if config.always_allow:
             console.print(
                 "[dim]Running automatically due to 'Always Allow' preference. Use /mode to change.[/dim]"
             )
-            run_ffmpeg_command(command)
+            run_ffmpeg_command(argv)
             break
 
         # Interactive Menu
-        # Ensure we are in a terminal that supports this, or fallback?
-        # Questionary handles this reasonably well.
-        choice = questionary.select(
-            "What would you like to do?",
-            choices=[
-                "Allow (Run command)",
-                "Always Allow (Save preference & Run)",
-                "Make Changes (Refine command)",
-                "Reject (Cancel)",
-            ],
-            use_indicator=True,
-            style=questionary.Style(
-                [
-                    ("qmark", "fg:#E91E63 bold"),
-                    ("question", "bold"),
-                    ("answer", "fg:#2196f3 bold"),
-                    ("pointer", "fg:#673ab7 bold"),
-                    ("highlighted", "fg:#673ab7 bold"),
-                    ("selected", "fg:#cc5454"),
-                    ("separator", "fg:#cc5454"),
-                    ("instruction", ""),
-                    ("text", ""),
-                    ("disabled", "fg:#858585 italic"),
-                ]
-            ),
-        ).ask()
+        # A single-key prompt avoids spinning up a full prompt_toolkit
+        # application for every generated command.
+        console.print(
+            "\n[bold]What would you like to do?[/bold]\n"
+            "  [bold green]a[/bold green] - Allow (Run command)\n"
+            "  [bold green]w[/bold green] - Always Allow (Save preference & Run)\n"
+            "  [bold green]c[/bold green] - Make Changes (Refine command)\n"
+            "  [bold green]r[/bold green] - Reject (Cancel)"
+        )
+        try:
+            choice = Prompt.ask("Choose", choices=list(MENU_CHOICES), default="a")
+        except (KeyboardInterrupt, EOFError):
+            choice = "r"
+        choice = MENU_CHOICES[choice]
 
         if choice == "Allow (Run command)":
-            run_ffmpeg_command(command)
+            run_ffmpeg_command(argv)
             break
         elif choice == "Always Allow (Save preference & Run)":
             config.always_allow = True
             console.print(
                 "[bold green]Preference saved![/bold green] Future commands will run automatically."
             )
-            run_ffmpeg_command(command)
+            run_ffmpeg_command(argv)
             break
         elif choice == "Make Changes (Refine command)":
-            refinement = questionary.text("Describe the changes needed:").ask()
+            try:
+                refinement = Prompt.ask("Describe the changes needed")
+            except (KeyboardInterrupt, EOFError):
+                refinement = None
             if refinement:
                 messages.append({"role": "user", "content": refinement})
+                messages = compact_history(messages, initial_prompt)
                 continue  # Loop back to generate new command
             else:
                 console.print(
@@ -337,40 +1016,83 @@ def process_request(client: OpenAI, initial_prompt: str):
             break
 
 
-def main():
-    banner = r"""
- [bold blue]_____                      _      ____________                          
-/  ___|                    | |     |  ___|  ___|                         
-\ `--. _ __ ___   __ _ _ __| |_    | |_  | |_ _ __ ___  _ __   ___  __ _ 
- `--. \ '_ ` _ \ / _` | '__| __|   |  _| |  _| '_ ` _ \| '_ \ / _ \/ _` |
-/\__/ / | | | | | (_| | |  | |_    | |   | | | | | | | | |_) |  __/ (_| |
-\____/|_| |_| |_|\__,_|_|   \__|   \_|   \_| |_| |_| |_| .__/ \___|\__, |
-                                                       | |          __/ |
-                                                       |_|         |___/ [/bold blue]
+class OpenRouterClient:
     """
-    console.print(banner)
+    Builds the OpenAI client on the first generation, so startup and slash
+    commands never import openai or open a connection.
+    """
+
+    def __init__(self):
+        self._client: Optional[OpenAI] = None
+        self._http_client = None
+
+    def get(self) -> OpenAI:
+        if self._client is None:
+            import httpx
+            from openai import DefaultHttpxClient, OpenAI
+
+            # One pooled HTTP/2 connection is reused across every request in the session
+            self._http_client = DefaultHttpxClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60),
+            )
+            self._client = OpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=get_api_key(),
+                http_client=self._http_client,
+            )
+        return self._client
+
+    def set_api_key(self, api_key: str):
+        if self._client is not None:
+            self._client.api_key = api_key
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+openrouter = OpenRouterClient()
+
+
+def main():
+    console.print(BANNER)
     console.print("[italic]AI-Powered FFmpeg Command Generator[/italic]\n")
 
-    api_key = get_api_key()
+    if ffmpeg_path() is None:
+        console.print(
+            "[yellow]Warning:[/yellow] 'ffmpeg' was not found on PATH. Commands will fail to run until it is installed."
+        )
+
+    get_api_key()
     ensure_model_name()
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
 
-    # Check for command line arguments (non-interactive mode)
-    if len(sys.argv) > 1:
-        prompt = " ".join(sys.argv[1:])
-        process_request(client, prompt)
-        return
+    try:
+        # Check for command line arguments (non-interactive mode)
+        if len(sys.argv) > 1:
+            prompt = " ".join(sys.argv[1:])
+            process_request(prompt)
+            return
+
+        interactive_loop()
+    finally:
+        openrouter.close()
+
 
-    # Interactive mode
+def interactive_loop():
+    pending: List[str] = []
     while True:
-        mode_str = "Always Allow" if config.always_allow else "Ask"
-        console.print(f"\n[dim]Current Mode: {mode_str} (Type /help for options)[/dim]")
-        console.print("[bold yellow]What do you want to do?[/bold yellow]")
+        if pending:
+            user_input = pending.pop(0)
+        else:
+            mode_str = "Always Allow" if config.always_allow else "Ask"
+            console.print(
+                f"\n[dim]Current Mode: {mode_str} (Type /help for options)[/dim]"
+            )
+            console.print("[bold yellow]What do you want to do?[/bold yellow]")
 
-        user_input = Prompt.ask(">>")
+            user_input = Prompt.ask(">>")
+            pending.extend(read_pending_lines(BATCH_SIZE - 1))
 
         if not user_input.strip():
             continue
@@ -388,6 +1110,8 @@ def main():
                     "[bold green]/model[/bold green]   - View or edit the model name.\n"
                     "[bold green]/api-key[/bold green] - Update the API key.\n"
                     "[bold green]/verbose[/bold green] - Toggle verbose output (FFmpeg logs).\n"
+                    "[bold green]/prompt-cache[/bold green] - Toggle the provider cache marker on the system prompt.\n"
+                    "[bold green]/clear-cache[/bold green] - Forget locally cached commands.\n"
                     "[bold green]/exit[/bold green]    - Quit the application.\n"
                     "[bold green]/help[/bold green]    - Show this help message.",
                     title="Help",
@@ -402,7 +1126,20 @@ def main():
             console.print(f"[bold green]Mode switched to: {new_mode}[/bold green]")
             continue
 
+        if user_input.strip() == "/prompt-cache":
+            config.prompt_caching = not config.prompt_caching
+            state = "enabled" if config.prompt_caching else "disabled"
+            console.print(f"[bold green]Provider prompt caching {state}.[/bold green]")
+            continue
+
+        if user_input.strip() == "/clear-cache":
+            command_cache.clear()
+            console.print("[bold green]Command cache cleared.[/bold green]")
+            continue
+
         if user_input.strip() == "/verbose":
+            import questionary
+
             choice = questionary.select(
                 "Enable Verbose Mode (Show FFmpeg output)?",
                 choices=["True", "False"],
@@ -416,6 +1153,8 @@ def main():
             continue
 
         if user_input.strip() == "/prompt":
+            import questionary
+
             while True:
                 prompt_choice = questionary.select(
                     "Custom System Prompt Management:",
@@ -469,6 +1208,7 @@ def main():
 
                         if new_content and new_content != initial_content:
                             config.custom_system_prompt = new_content
+                            config.save_config()
                             console.print(
                                 "[bold green]System prompt updated![/bold green]"
                             )
@@ -493,6 +1233,7 @@ def main():
                             "Are you sure you want to clear the custom prompt and revert to default?"
                         ).ask():
                             config.custom_system_prompt = None
+                            config.save_config()
                             console.print(
                                 "[bold green]Reverted to default system prompt.[/bold green]"
                             )
@@ -506,24 +1247,51 @@ def main():
             continue
 
         if user_input.strip() == "/model":
+            import questionary
+
             current_model = config.model or os.getenv("OPENROUTER_MODEL") or ""
             new_model = questionary.text(
                 "Enter new model name:", default=current_model
             ).ask()
             if new_model:
                 config.model = new_model
+                config.save_config()
                 console.print(f"[bold green]Model updated to: {new_model}[/bold green]")
             continue
 
         if user_input.strip() == "/api-key":
+            import questionary
+
             new_key = questionary.password("Enter new API key:").ask()
             if new_key:
                 config.api_key = new_key
-                client.api_key = new_key
+                config.save_config()
+                openrouter.set_api_key(new_key)
                 console.print("[bold green]API Key updated![/bold green]")
             continue
 
-        process_request(client, user_input)
+        # Requests that arrived together are generated in a single API call.
+        # Prompts naming existing media files are generated individually so the
+        # model sees their ffprobe metadata and the result is not cached.
+        batch = [user_input]
+        if not media_context(user_input):
+            while (
+                pending
+                and len(batch) < BATCH_SIZE
+                and pending[0].strip()
+                and not pending[0].strip().startswith("/")
+                and not media_context(pending[0])
+            ):
+                batch.append(pending.pop(0))
+
+        results = (
+            get_ffmpeg_commands(openrouter.get(), batch) if len(batch) > 1 else None
+        )
+        if results is None:
+            results = [None] * len(batch)
+
+        for prompt, result in zip(batch, results):
+            process_request(prompt, result)
 
 
 if __name__ == "__main__":